@@ -4,7 +4,12 @@ from datetime import datetime
 
 from dotenv import load_dotenv
 
-from tiktok_extractor import TikTokMaxDataExtractor, load_credentials
+from tiktok_extractor import (
+    RESPONSE_CACHE_DIR,
+    RESPONSE_CACHE_TTL,
+    TikTokMaxDataExtractor,
+    load_credentials,
+)
 
 
 def parse_args() -> argparse.Namespace:
@@ -15,6 +20,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--include-comments", action="store_true")
     parser.add_argument("--max-videos-for-comments", type=int, default=10)
     parser.add_argument("--max-comments-per-video", type=int, default=30)
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached responses")
+    parser.add_argument("--cache-ttl", type=float, default=RESPONSE_CACHE_TTL, help="Seconds a cached response stays valid")
     return parser.parse_args()
 
 
@@ -22,14 +29,18 @@ def main() -> None:
     logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     load_dotenv()
 
+    args = parse_args()
+
     creds = load_credentials()
-    extractor = TikTokMaxDataExtractor(creds)
+    extractor = TikTokMaxDataExtractor(
+        creds,
+        cache_dir=None if args.no_cache else RESPONSE_CACHE_DIR,
+        cache_ttl=args.cache_ttl,
+    )
 
     if not extractor.get_token():
         raise RuntimeError("Failed to obtain access token")
 
-    args = parse_args()
-
     all_data = extractor.extract_all_data(
         username=args.username,
         max_videos=args.max_videos,
@@ -45,7 +56,8 @@ def main() -> None:
     )
 
     filename = f"{args.username}_FULL_DATA_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    extractor.save_json(all_data, filename)
+    # Serialize and write the output while the usage log and summary are handled.
+    saved = extractor.save_json_in_background(all_data, filename)
     extractor.log_daily_usage()
 
     print("\nDATA SUMMARY:")
@@ -59,9 +71,9 @@ def main() -> None:
     videos = (all_data.get("videos") or {}).get("data", {}).get("videos", [])
     print(f"Videos extracted: {len(videos)}")
 
-    comments = all_data.get("comments") or {}
-    total_comments = sum(len(c.get("data", {}).get("comments", [])) for c in comments.values())
-    print(f"Comments extracted: {total_comments}")
+    print(f"Comments extracted: {all_data.get('comments_total', 0)}")
+
+    saved.result()
 
 
 if __name__ == "__main__":
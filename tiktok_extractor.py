@@ -1,20 +1,42 @@
 from __future__ import annotations
 
-import json
+import hashlib
 import logging
 import os
+import random
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO, Deque, Dict, Iterator, Optional
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 LOG = logging.getLogger(__name__)
 
 BASE_URL = "https://open.tiktokapis.com"
 MAX_PER_REQUEST = 100
 DAILY_LIMIT = 1000
+REQUESTS_PER_MINUTE = 60
+TOKEN_CACHE_FILE = ".tiktok_token_cache.json"
+# Refresh cached tokens this many seconds before TikTok says they expire.
+TOKEN_EXPIRY_MARGIN = 60
+RESPONSE_CACHE_DIR = ".cache"
+RESPONSE_CACHE_TTL = 3600
+USAGE_LOG_FILE = "tiktok_api_usage_log.jsonl"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Field lists requested from the research endpoints.
+_USER_INFO_FIELDS = "display_name,bio_description,avatar_url,is_verified,follower_count,following_count,likes_count,video_count,bio_url"
+_USER_LIST_FIELDS = "display_name,username"
+_VIDEO_FIELDS_FULL = "id,video_description,create_time,username,region_code,like_count,comment_count,share_count,view_count,music_id,hashtag_names,effect_ids,playlist_id,voice_to_text,video_duration,favorites_count,is_stem_verified"
+_VIDEO_FIELDS_BASIC = "id,video_description,create_time,username,like_count,comment_count,share_count,view_count"
+_COMMENT_FIELDS = "id,video_id,text,like_count,reply_count,parent_comment_id,create_time"
 
 
 @dataclass(frozen=True)
@@ -49,59 +71,465 @@ def load_credentials() -> TikTokCredentials:
     return TikTokCredentials(client_key=client_key, client_secret=client_secret)
 
 
+class _RateLimiter:
+    """Thread-safe sliding-window limiter for a per-minute request quota.
+
+    Callers only wait when the last ``max_calls`` requests all fall inside the
+    window, and then only until the oldest of them ages out. A 429 halves the
+    capacity at most once per window; each following window without one
+    doubles it again, up to ``max_calls``.
+    """
+
+    def __init__(self, max_calls: float, window_s: float = 60.0) -> None:
+        self._window_s = window_s
+        self._max_calls = max(1, int(max_calls))
+        self._call_times: Deque[float] = deque(maxlen=self._max_calls)
+        self._paused_until = 0.0
+        self._last_slow_down = float("-inf")
+        self._last_speed_up = float("-inf")
+        self._lock = threading.Lock()
+
+    def _resize(self, max_calls: int) -> None:
+        self._call_times = deque(self._call_times, maxlen=max_calls)
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                capacity = self._call_times.maxlen
+                quiet_since = max(self._last_slow_down, self._last_speed_up)
+                if capacity < self._max_calls and now - quiet_since >= self._window_s:
+                    self._resize(min(self._max_calls, capacity * 2))
+                    self._last_speed_up = now
+                    LOG.info("No rate limiting for a while; raising to %s req/min", self._call_times.maxlen)
+                while self._call_times and now - self._call_times[0] >= self._window_s:
+                    self._call_times.popleft()
+                if now >= self._paused_until and len(self._call_times) < self._call_times.maxlen:
+                    self._call_times.append(now)
+                    return
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    wait = self._call_times[0] + self._window_s - now
+            time.sleep(wait)
+
+    def slow_down(self, retry_after: Optional[float] = None) -> None:
+        """Halve the allowed calls per window after a 429.
+
+        A burst of 429s from concurrent workers counts as one: calls within a
+        window of the last slow-down only extend the pause.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if now - self._last_slow_down < self._window_s:
+                return
+            max_calls = max(1, self._call_times.maxlen // 2)
+            self._resize(max_calls)
+            self._last_slow_down = now
+        LOG.warning("Rate limited; slowing to %s req/min", max_calls)
+
+
+def _retry_after_seconds(headers: Any, *, rate_limited: bool) -> Optional[float]:
+    """Read the server's back-off hint from Retry-After.
+
+    X-RateLimit-Reset says when the quota resets rather than how long to back
+    off, so it is only consulted for 429 responses (``rate_limited``).
+    """
+    value = headers.get("Retry-After")
+    if value is not None:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+    reset = headers.get("X-RateLimit-Reset") if rate_limited else None
+    if reset is not None:
+        try:
+            reset_at = float(reset)
+        except ValueError:
+            return None
+        # Large values are epoch timestamps, small ones are relative seconds.
+        return max(0.0, reset_at - time.time()) if reset_at > 1e9 else reset_at
+    return None
+
+
+def _seconds_until_daily_reset() -> float:
+    """Seconds until the daily quota resets at midnight UTC."""
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+def _reverse_lines(handle: BinaryIO, chunk_size: int = 8192) -> Iterator[bytes]:
+    """Yield the non-empty lines of a binary file from last to first."""
+    handle.seek(0, os.SEEK_END)
+    position = handle.tell()
+    remainder = b""
+    while position > 0:
+        size = min(chunk_size, position)
+        position -= size
+        handle.seek(position)
+        lines = (handle.read(size) + remainder).split(b"\n")
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line.strip():
+                yield line
+    if remainder.strip():
+        yield remainder
+
+
+def _parse_usage_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Decode one usage-log line, or None if it is torn or not an entry."""
+    try:
+        entry = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        return None
+    return entry if isinstance(entry, dict) and "date" in entry else None
+
+
+def read_daily_usage(day: str, log_file: str = USAGE_LOG_FILE) -> int:
+    """Return the requests logged for ``day`` (YYYY-MM-DD) at the end of the log.
+
+    Entries are appended in date order, so only the trailing run of lines for
+    ``day`` is read; earlier days return 0. Use it for today's usage. Lines that
+    fail to parse, e.g. from a run killed mid-write, are skipped.
+    """
+    total = 0
+    try:
+        with open(log_file, "rb") as handle:
+            for line in _reverse_lines(handle):
+                entry = _parse_usage_line(line)
+                if entry is None:
+                    continue
+                if entry.get("date") != day:
+                    break
+                total += entry.get("count", 0)
+    except FileNotFoundError:
+        return 0
+    return total
+
+
+def compact_usage_log(log_file: str = USAGE_LOG_FILE) -> None:
+    """Rewrite the usage log with a single line per day, dropping unreadable lines.
+
+    Nothing calls this automatically. Run it by hand between extractions: a
+    log_daily_usage() append made while it runs can be lost.
+    """
+    totals: Dict[str, int] = {}
+    try:
+        with open(log_file, "rb") as handle:
+            for line in handle:
+                entry = _parse_usage_line(line) if line.strip() else None
+                if entry is not None:
+                    totals[entry["date"]] = totals.get(entry["date"], 0) + entry.get("count", 0)
+    except FileNotFoundError:
+        return
+
+    tmp_path = f"{log_file}.tmp"
+    with open(tmp_path, "wb") as handle:
+        for day, count in totals.items():
+            handle.write(orjson.dumps({"date": day, "count": count}) + b"\n")
+    os.replace(tmp_path, log_file)
+
+
 class TikTokMaxDataExtractor:
-    def __init__(self, credentials: TikTokCredentials, *, timeout: int = 30) -> None:
+    # orjson options for save_json; numpy support lets notebook callers save
+    # arrays they have added to the extracted data.
+    _JSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def __init__(
+        self,
+        credentials: TikTokCredentials,
+        *,
+        timeout: int = 30,
+        max_workers: int = 4,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        max_concurrent: int = 4,
+        token_cache: Optional[str] = TOKEN_CACHE_FILE,
+        cache_dir: Optional[str] = RESPONSE_CACHE_DIR,
+        cache_ttl: float = RESPONSE_CACHE_TTL,
+        usage_log_file: str = USAGE_LOG_FILE,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 60.0,
+    ) -> None:
         self.client_key = credentials.client_key
         self.client_secret = credentials.client_secret
         self.token: Optional[str] = None
         self.request_count = 0
-        self._session = requests.Session()
         self._timeout = timeout
+        self._max_workers = max(1, max_workers)
+        self._session = self._build_session(max(self._max_workers, max_concurrent))
+        self._count_lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        # Token issued by the last 401-triggered refresh, and whether the API
+        # rejected even that one (then further refreshes would not help).
+        self._refreshed_token: Optional[str] = None
+        self._auth_failed = False
+        self._limiter = _RateLimiter(requests_per_minute)
+        self._inflight = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._token_cache = token_cache
+        self._cache_dir = cache_dir
+        self._cache_ttl = cache_ttl
+        self._usage_log_file = usage_log_file
+        self._max_retries = max(0, max_retries)
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        # Requests already written to the usage log, and requests still allowed
+        # today (None until extract_all_data() checks the log).
+        self._logged_count = 0
+        self._budget: Optional[int] = None
+
+    @staticmethod
+    def _build_session(pool_size: int) -> requests.Session:
+        """Create a keep-alive session whose pool fits every concurrent worker."""
+        # Only failed connections are retried here; status-based retries live in
+        # _post so every attempt goes through the rate limiter and budget.
+        retry = Retry(total=None, connect=3, read=0, status=0, backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        return session
+
+    def _count_request(self) -> None:
+        with self._count_lock:
+            self.request_count += 1
+
+    def _reserve_request(self) -> bool:
+        """Take one request from today's budget; False once it is used up."""
+        with self._count_lock:
+            if self._budget is None:
+                return True
+            if self._budget <= 0:
+                return False
+            self._budget -= 1
+            return True
+
+    def _load_cached_token(self) -> Optional[str]:
+        if not self._token_cache:
+            return None
+        try:
+            with open(self._token_cache, "rb") as handle:
+                cached = orjson.loads(handle.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if not isinstance(cached, dict) or cached.get("client_key") != self.client_key:
+            return None
+        if time.time() >= cached.get("expires_at", 0) - TOKEN_EXPIRY_MARGIN:
+            return None
+        return cached.get("token")
+
+    def _store_cached_token(self, token: str, expires_in: int) -> None:
+        if not self._token_cache:
+            return
+        cached = {
+            "client_key": self.client_key,
+            "token": token,
+            "expires_at": time.time() + expires_in,
+        }
+        tmp_path = f"{self._token_cache}.tmp"
+        # The token is a credential, so keep the file private to the user.
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(orjson.dumps(cached))
+        os.replace(tmp_path, self._token_cache)
 
     def get_token(self) -> bool:
-        """Get an access token via client credentials."""
+        """Get an access token via client credentials.
+
+        A still-valid token from a previous run is reused from the token cache
+        file, which saves one request against the daily limit.
+        """
+        cached_token = self._load_cached_token()
+        if cached_token:
+            self._set_token(cached_token)
+            LOG.info("Token loaded from cache")
+            return True
+
         url = f"{BASE_URL}/v2/oauth/token/"
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        # None drops the session's Bearer header, which may hold a rejected token.
+        headers = {"Content-Type": "application/x-www-form-urlencoded", "Authorization": None}
         data = {
             "client_key": self.client_key,
             "client_secret": self.client_secret,
             "grant_type": "client_credentials",
         }
 
+        if not self._reserve_request():
+            LOG.error("Daily request budget exhausted; cannot request a token")
+            return False
+        self._limiter.acquire()
         response = self._session.post(url, headers=headers, data=data, timeout=self._timeout)
-        self.request_count += 1
+        self._count_request()
 
         if response.status_code == 200:
-            self.token = response.json().get("access_token")
+            payload = orjson.loads(response.content)
+            token = payload.get("access_token")
+            if not token:
+                LOG.error("Token error: response has no access_token")
+                return False
+            self._set_token(token)
+            if payload.get("expires_in"):
+                self._store_cached_token(token, int(payload["expires_in"]))
             LOG.info("Token obtained")
             return True
 
         LOG.error("Token error: %s - %s", response.status_code, response.text)
         return False
 
-    def _auth_headers(self) -> Dict[str, str]:
+    def _refresh_token(self, rejected_token: Optional[str]) -> bool:
+        """Replace a token the API rejected, fetching at most once across workers.
+
+        Returns False without fetching once a freshly issued token has been
+        rejected too, since the credentials themselves are then the problem.
+        """
+        with self._token_lock:
+            if self._auth_failed:
+                return False
+            if self.token != rejected_token:
+                # Another worker already refreshed it.
+                return True
+            if rejected_token == self._refreshed_token:
+                LOG.error("A freshly issued access token was rejected too; giving up")
+                self._auth_failed = True
+                return False
+            LOG.warning("Access token rejected; requesting a new one")
+            if self._token_cache:
+                try:
+                    os.remove(self._token_cache)
+                except FileNotFoundError:
+                    pass
+            if not self.get_token():
+                self._auth_failed = True
+                return False
+            self._refreshed_token = self.token
+            return True
+
+    def _set_token(self, token: str) -> None:
+        # Set the auth headers once on the session rather than building them per request.
+        self.token = token
+        self._auth_failed = False
+        self._session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def _cache_path(self, endpoint: str, params: Optional[Dict[str, Any]], body: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not self._cache_dir or self._cache_ttl <= 0:
+            return None
+        request_key = orjson.dumps(
+            {"params": params, "body": body}, option=orjson.OPT_SORT_KEYS
+        )
+        digest = hashlib.blake2b(endpoint.encode() + request_key, digest_size=20).hexdigest()
+        return os.path.join(self._cache_dir, f"{digest}.json")
+
+    def _read_cache(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            if time.time() - os.path.getmtime(path) > self._cache_ttl:
+                return None
+            with open(path, "rb") as handle:
+                return orjson.loads(handle.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_cache(self, path: str, content: bytes) -> None:
+        os.makedirs(self._cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(content)
+        os.replace(tmp_path, path)
+
+    def _post(self, endpoint: str, *, params: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         if not self.token:
             raise RuntimeError("Token not set. Call get_token() first.")
-        return {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-        }
 
-    def _post(self, endpoint: str, *, params: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-        url = f"{BASE_URL}{endpoint}"
-        response = self._session.post(url, headers=self._auth_headers(), params=params, json=body, timeout=self._timeout)
-        self.request_count += 1
+        # The one guard for page sizes: the API rejects max_count above its cap.
+        if body and body.get("max_count", 0) > MAX_PER_REQUEST:
+            body = dict(body, max_count=MAX_PER_REQUEST)
 
-        if response.status_code == 200:
-            return response.json()
+        # Research queries are read-only, so identical requests within the TTL
+        # are served from disk without spending any of the daily quota.
+        cache_path = self._cache_path(endpoint, params, body)
+        if cache_path:
+            cached = self._read_cache(cache_path)
+            if cached is not None:
+                LOG.debug("Cache hit for %s", endpoint)
+                return cached
+
+        if self._auth_failed:
+            LOG.error("Access token rejected; skipping %s", endpoint)
+            return None
+
+        url = f"{BASE_URL}{endpoint}"
+        # Encode the body once with orjson and send the bytes on every attempt;
+        # the session already carries the application/json Content-Type.
+        payload = orjson.dumps(body) if body is not None else None
+        attempt = 0
+        token_refreshed = False
+        while True:
+            if not self._reserve_request():
+                LOG.error("Daily request budget exhausted; skipping %s", endpoint)
+                return None
+
+            self._limiter.acquire()
+            sent_token = self.token
+            # stream=True keeps the body as raw bytes until we read it; orjson then
+            # decodes those bytes directly without building an intermediate str.
+            with self._inflight, self._session.post(
+                url, params=params, data=payload, timeout=self._timeout, stream=True
+            ) as response:
+                content = response.content
+            self._count_request()
+
+            if response.status_code == 200:
+                data = orjson.loads(content)
+                if cache_path:
+                    self._write_cache(cache_path, content)
+                return data
+
+            # A revoked or rotated token fails every call; refresh it once and retry.
+            if response.status_code == 401:
+                if self._refresh_token(sent_token) and not token_refreshed:
+                    token_refreshed = True
+                    continue
+                break
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self._max_retries:
+                break
+
+            rate_limited = response.status_code == 429
+            retry_after = _retry_after_seconds(response.headers, rate_limited=rate_limited)
+            if retry_after is not None and retry_after >= _seconds_until_daily_reset():
+                # Nothing will succeed before the daily quota resets.
+                LOG.warning("Request to %s is blocked until the daily reset; not retrying", endpoint)
+                break
+            if retry_after is not None:
+                # Wait no longer than one backoff cap, then try again.
+                delay = min(retry_after, self._backoff_cap)
+            else:
+                # Exponential backoff with jitter so concurrent workers spread out.
+                delay = min(self._backoff_cap, self._backoff_base * 2**attempt)
+                delay += random.uniform(0, self._backoff_base)
+            if rate_limited:
+                self._limiter.slow_down(delay if retry_after is not None else None)
+            LOG.warning(
+                "Request to %s failed with %s; retrying in %.1fs",
+                endpoint,
+                response.status_code,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
 
         LOG.warning("Request failed: %s - %s", response.status_code, response.text)
         return None
 
     def get_user_profile(self, username: str) -> Optional[Dict[str, Any]]:
-        params = {
-            "fields": "display_name,bio_description,avatar_url,is_verified,follower_count,following_count,likes_count,video_count,bio_url",
-        }
+        params = {"fields": _USER_INFO_FIELDS}
         body = {"username": username}
         return self._post("/v2/research/user/info/", params=params, body=body)
 
@@ -110,10 +538,9 @@ class TikTokMaxDataExtractor:
 
         TikTok limits searches to 30 days per request. If you want longer periods,
         call this multiple times or implement chunking in the notebook.
+
         """
-        params = {
-            "fields": "id,video_description,create_time,username,region_code,like_count,comment_count,share_count,view_count,music_id,hashtag_names,effect_ids,playlist_id,voice_to_text,video_duration,favorites_count,is_stem_verified",
-        }
+        params = {"fields": _VIDEO_FIELDS_FULL}
 
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
@@ -129,48 +556,119 @@ class TikTokMaxDataExtractor:
             },
             "start_date": start_date.strftime("%Y%m%d"),
             "end_date": end_date.strftime("%Y%m%d"),
-            "max_count": min(max_videos, MAX_PER_REQUEST),
+            "max_count": max_videos,
         }
         return self._post("/v2/research/video/query/", params=params, body=body)
 
     def get_video_comments(self, video_id: str, *, max_count: int = 100) -> Optional[Dict[str, Any]]:
-        params = {
-            "fields": "id,video_id,text,like_count,reply_count,parent_comment_id,create_time",
-        }
-        body = {"video_id": video_id, "max_count": min(max_count, MAX_PER_REQUEST)}
+        params = {"fields": _COMMENT_FIELDS}
+        body = {"video_id": video_id, "max_count": max_count}
         return self._post("/v2/research/video/comment/list/", params=params, body=body)
 
     def get_followers(self, username: str, *, max_count: int = 100) -> Optional[Dict[str, Any]]:
-        params = {"fields": "display_name,username"}
-        body = {"username": username, "max_count": min(max_count, MAX_PER_REQUEST)}
+        params = {"fields": _USER_LIST_FIELDS}
+        body = {"username": username, "max_count": max_count}
         return self._post("/v2/research/user/followers/", params=params, body=body)
 
     def get_following(self, username: str, *, max_count: int = 100) -> Optional[Dict[str, Any]]:
-        params = {"fields": "display_name,username"}
-        body = {"username": username, "max_count": min(max_count, MAX_PER_REQUEST)}
+        params = {"fields": _USER_LIST_FIELDS}
+        body = {"username": username, "max_count": max_count}
         return self._post("/v2/research/user/following/", params=params, body=body)
 
     def get_liked_videos(self, username: str, *, max_count: int = 100) -> Optional[Dict[str, Any]]:
-        params = {
-            "fields": "id,video_description,create_time,username,like_count,comment_count,share_count,view_count",
-        }
-        body = {"username": username, "max_count": min(max_count, MAX_PER_REQUEST)}
+        params = {"fields": _VIDEO_FIELDS_BASIC}
+        body = {"username": username, "max_count": max_count}
         return self._post("/v2/research/user/liked_videos/", params=params, body=body)
 
     def get_pinned_videos(self, username: str) -> Optional[Dict[str, Any]]:
-        params = {
-            "fields": "id,video_description,create_time,username,like_count,comment_count,share_count,view_count",
-        }
+        params = {"fields": _VIDEO_FIELDS_BASIC}
         body = {"username": username}
         return self._post("/v2/research/user/pinned_videos/", params=params, body=body)
 
     def get_reposted_videos(self, username: str, *, max_count: int = 100) -> Optional[Dict[str, Any]]:
-        params = {
-            "fields": "id,video_description,create_time,username,like_count,comment_count,share_count,view_count",
-        }
-        body = {"username": username, "max_count": min(max_count, MAX_PER_REQUEST)}
+        params = {"fields": _VIDEO_FIELDS_BASIC}
+        body = {"username": username, "max_count": max_count}
         return self._post("/v2/research/user/reposted_videos/", params=params, body=body)
 
+    def _iter_pages(
+        self,
+        endpoint: str,
+        items_key: str,
+        *,
+        params: Dict[str, Any],
+        body: Dict[str, Any],
+        page_size: int,
+        max_items: Optional[int],
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield items across cursor pages, fetching page N+1 while page N is consumed."""
+        def fetch(cursor: Optional[Any]) -> Optional[Dict[str, Any]]:
+            page_body = dict(body, max_count=page_size)
+            if cursor is not None:
+                page_body["cursor"] = cursor
+            return self._post(endpoint, params=params, body=page_body)
+
+        yielded = 0
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            future: Optional[Future] = prefetcher.submit(fetch, None)
+            while future is not None:
+                page = future.result()
+                if not page:
+                    return
+                data = page.get("data", {})
+                items = data.get(items_key, [])
+                if max_items is not None:
+                    items = items[: max_items - yielded]
+                yielded += len(items)
+
+                future = None
+                if data.get("has_more") and items and (max_items is None or yielded < max_items):
+                    future = prefetcher.submit(fetch, data.get("cursor"))
+                yield from items
+
+    def iter_followers(self, username: str, *, page_size: int = MAX_PER_REQUEST, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        params = {"fields": _USER_LIST_FIELDS}
+        return self._iter_pages(
+            "/v2/research/user/followers/",
+            "user_followers",
+            params=params,
+            body={"username": username},
+            page_size=page_size,
+            max_items=max_items,
+        )
+
+    def iter_following(self, username: str, *, page_size: int = MAX_PER_REQUEST, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        params = {"fields": _USER_LIST_FIELDS}
+        return self._iter_pages(
+            "/v2/research/user/following/",
+            "user_following",
+            params=params,
+            body={"username": username},
+            page_size=page_size,
+            max_items=max_items,
+        )
+
+    def iter_liked_videos(self, username: str, *, page_size: int = MAX_PER_REQUEST, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        params = {"fields": _VIDEO_FIELDS_BASIC}
+        return self._iter_pages(
+            "/v2/research/user/liked_videos/",
+            "user_liked_videos",
+            params=params,
+            body={"username": username},
+            page_size=page_size,
+            max_items=max_items,
+        )
+
+    def iter_reposted_videos(self, username: str, *, page_size: int = MAX_PER_REQUEST, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        params = {"fields": _VIDEO_FIELDS_BASIC}
+        return self._iter_pages(
+            "/v2/research/user/reposted_videos/",
+            "user_reposted_videos",
+            params=params,
+            body={"username": username},
+            page_size=page_size,
+            max_items=max_items,
+        )
+
     def extract_all_data(
         self,
         *,
@@ -187,6 +685,14 @@ class TikTokMaxDataExtractor:
         include_reposted_videos: bool = True,
     ) -> Dict[str, Any]:
         LOG.info("Extracting data for @%s", username)
+        max_videos = min(max_videos, MAX_PER_REQUEST)
+        max_comments_per_video = min(max_comments_per_video, MAX_PER_REQUEST)
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        unlogged = self.request_count - self._logged_count
+        self._budget = DAILY_LIMIT - read_daily_usage(today, self._usage_log_file) - unlogged
+        if self._budget <= 0:
+            raise RuntimeError(f"Daily request budget exhausted ({DAILY_LIMIT} requests per day)")
 
         all_data: Dict[str, Any] = {
             "username": username,
@@ -194,6 +700,7 @@ class TikTokMaxDataExtractor:
             "profile": None,
             "videos": None,
             "comments": {},
+            "comments_total": 0,
             "followers": None,
             "following": None,
             "liked_videos": None,
@@ -201,73 +708,120 @@ class TikTokMaxDataExtractor:
             "reposted_videos": None,
         }
 
-        all_data["profile"] = self.get_user_profile(username)
-        time.sleep(0.3)
-
-        all_data["videos"] = self.get_user_videos(
-            username,
-            days_back=days_back,
-            max_videos=max_videos,
-        )
-        time.sleep(0.3)
-
-        if include_comments and all_data["videos"]:
-            videos = all_data["videos"].get("data", {}).get("videos", [])
-            videos_to_process = (
-                videos if max_videos_for_comments is None else videos[:max_videos_for_comments]
+        optional_calls = [
+            ("followers", include_followers, self.get_followers),
+            ("following", include_following, self.get_following),
+            ("liked_videos", include_liked_videos, self.get_liked_videos),
+            ("pinned_videos", include_pinned_videos, self.get_pinned_videos),
+            ("reposted_videos", include_reposted_videos, self.get_reposted_videos),
+        ]
+        optional_calls = [(key, call) for key, enabled, call in optional_calls if enabled]
+
+        # Decide before anything is submitted, while the budget is untouched.
+        # With enough budget everything runs at once. Otherwise the optional
+        # endpoints wait until the profile, videos and comments have been fetched.
+        budget = self._budget
+        planned_comments = 0
+        if include_comments:
+            planned_comments = (
+                max_videos if max_videos_for_comments is None else min(max_videos, max_videos_for_comments)
             )
-            comments_dict: Dict[str, Any] = {}
-            for video in videos_to_process:
-                video_id = video.get("id")
-                if not video_id:
-                    continue
-                comments = self.get_video_comments(
-                    str(video_id), max_count=max_comments_per_video
+        priority_order = budget < 2 + planned_comments + len(optional_calls)
+        if priority_order:
+            LOG.warning("Only %s requests left today; fetching in priority order", budget)
+
+        # Every endpoint below is independent, so they share one bounded pool
+        # and wall-clock time tracks the slowest call instead of their sum.
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            futures = {
+                "profile": pool.submit(self.get_user_profile, username),
+                "videos": pool.submit(
+                    self.get_user_videos,
+                    username,
+                    days_back=days_back,
+                    max_videos=max_videos,
+                ),
+            }
+            if not priority_order:
+                for key, call in optional_calls:
+                    futures[key] = pool.submit(call, username)
+
+            all_data["videos"] = futures.pop("videos").result()
+
+            if include_comments and all_data["videos"]:
+                videos = all_data["videos"].get("data", {}).get("videos", [])
+                # Drop videos without an id before slicing so the limit counts
+                # only videos we can actually fetch comments for.
+                valid = [video for video in videos if video.get("id")]
+                videos_to_process = (
+                    valid if max_videos_for_comments is None else valid[:max_videos_for_comments]
                 )
-                if comments:
-                    comments_dict[str(video_id)] = comments
-                time.sleep(0.3)
-            all_data["comments"] = comments_dict
-
-        if include_followers:
-            all_data["followers"] = self.get_followers(username)
-            time.sleep(0.3)
-
-        if include_following:
-            all_data["following"] = self.get_following(username)
-            time.sleep(0.3)
-
-        if include_liked_videos:
-            all_data["liked_videos"] = self.get_liked_videos(username)
-            time.sleep(0.3)
-
-        if include_pinned_videos:
-            all_data["pinned_videos"] = self.get_pinned_videos(username)
-            time.sleep(0.3)
-
-        if include_reposted_videos:
-            all_data["reposted_videos"] = self.get_reposted_videos(username)
+                comment_futures = {
+                    pool.submit(
+                        self.get_video_comments,
+                        str(video["id"]),
+                        max_count=max_comments_per_video,
+                    ): str(video["id"])
+                    for video in videos_to_process
+                }
+                # Consume comment pages as they finish rather than in submit order,
+                # so one slow video does not hold back the rest.
+                comments_dict: Dict[str, Any] = {}
+                total_comments = 0
+                for future in as_completed(comment_futures):
+                    comments = future.result()
+                    if comments:
+                        comments_dict[comment_futures[future]] = comments
+                        total_comments += len(comments.get("data", {}).get("comments", []))
+                all_data["comments"] = comments_dict
+                all_data["comments_total"] = total_comments
+
+            if priority_order:
+                for key, call in optional_calls:
+                    futures[key] = pool.submit(call, username)
+
+            for key, future in futures.items():
+                all_data[key] = future.result()
 
         LOG.info("Extraction complete. Requests used: %s", self.request_count)
         return all_data
 
     def save_json(self, data: Dict[str, Any], filename: str) -> None:
-        with open(filename, "w", encoding="utf-8") as handle:
-            json.dump(data, handle, indent=2, ensure_ascii=False)
+        # orjson already produces UTF-8 bytes, so write them as-is.
+        with open(filename, "wb") as handle:
+            handle.write(orjson.dumps(data, option=self._JSON_OPTS))
         LOG.info("Data saved to %s", filename)
 
-    def log_daily_usage(self, log_file: str = "tiktok_api_usage_log.json") -> Dict[str, int]:
+    def save_json_in_background(self, data: Dict[str, Any], filename: str) -> Future:
+        """Run save_json() on a writer thread; the returned future re-raises write errors."""
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save_json")
+        future = writer.submit(self.save_json, data, filename)
+        # The queued write still runs to completion; this only releases the executor.
+        writer.shutdown(wait=False)
+        return future
+
+    def log_daily_usage(self, log_file: Optional[str] = None) -> Dict[str, int]:
+        """Append requests made since the last call to the usage log and report today's total.
+
+        The log is append-only JSON Lines and is never compacted here; run
+        compact_usage_log() by hand between extractions to shrink it.
+        """
+        log_file = log_file or self._usage_log_file
         today = datetime.now().strftime("%Y-%m-%d")
-        try:
-            with open(log_file, "r", encoding="utf-8") as handle:
-                log = json.load(handle)
-        except FileNotFoundError:
-            log = {}
-
-        log[today] = log.get(today, 0) + self.request_count
-        with open(log_file, "w", encoding="utf-8") as handle:
-            json.dump(log, handle, indent=2)
-
-        remaining = DAILY_LIMIT - log[today]
-        LOG.info("Daily usage: %s/%s. Remaining: %s", log[today], DAILY_LIMIT, remaining)
-        return log
+        with self._count_lock:
+            count = self.request_count - self._logged_count
+            self._logged_count = self.request_count
+        entry = {"date": today, "count": count, "ts": time.time(), "pid": os.getpid()}
+        line = orjson.dumps(entry) + b"\n"
+        with open(log_file, "ab+") as handle:
+            # Start on a fresh line if an earlier write was cut off mid-line.
+            if handle.seek(0, os.SEEK_END) > 0:
+                handle.seek(-1, os.SEEK_END)
+                if handle.read(1) != b"\n":
+                    line = b"\n" + line
+            handle.write(line)
+
+        used = read_daily_usage(today, log_file)
+        remaining = DAILY_LIMIT - used
+        LOG.info("Daily usage: %s/%s. Remaining: %s", used, DAILY_LIMIT, remaining)
+        return {today: used}